@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+"""Scaling and cost metrics calculated from aggregated timing results.
+
+All of the table level functions work on the whole results dataframe at once,
+using a grouped transform to find the single compute element baseline of each
+result group, rather than looping over the groups.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Names of the optional hardware columns. When present in the results
+# dataframe they are used by calculate_cost_metrics.
+NODES_COLUMN = "nodes"
+CORES_PER_NODE_COLUMN = "cores_per_node"
+ENERGY_COLUMN = "energy"
+MEMORY_COLUMN = "memory"
+
+# Outlier detection methods for flag_outliers, mapped to their default
+# thresholds. Each run is scored against the spread of only a few other runs,
+# so the thresholds are high enough to leave clean cells of 3 to 5 runs alone
+# while still catching stragglers.
+OUTLIER_THRESHOLDS = {
+    "mad": 30.0,
+    "iqr": 30.0,
+    "zscore": 30.0,
+}
+
+# Smallest spread used by flag_outliers, as a fraction of the typical walltime
+# of the other runs. Tied walltimes, common at whole second resolution, would
+# otherwise give a zero spread.
+OUTLIER_MIN_SPREAD = 0.01
+
+# Metric columns added by calculate_cost_metrics, mapped to their plot labels
+COST_METRICS = {
+    "throughput": "Throughput (work units / second)",
+    "core_hours": "Core hours",
+    "cost": "Cost per run",
+    "energy_efficiency": "Energy efficiency (work units / joule)",
+    "parallel_overhead": "Parallel overhead",
+    "memory_per_element": "Memory per compute element",
+}
+
+
+def calculate_speedup_and_efficiency(
+    rdf, compute_element_col_index, time_col_index, group_cols=None
+):
+    """Calculates the speedup and efficiency and
+    adds them as new columns to a dataframe
+
+    rdf: the results dataframe
+    compute_element_col_index: compute elements column name
+    time_col_index: column name containing the computation times
+    group_cols: optional columns that together identify a result group. If
+        given, rdf may hold many groups and each row is compared to the t1
+        value of its own group. Otherwise rdf must hold a single group.
+
+    Returns: a tuple containing the speedup, strong scaling efficiency, and
+    weak scaling efficiency series
+    """
+    # get the t1 reference value
+    if group_cols:
+        t1 = baseline_walltime(
+            rdf, group_cols, compute_element_col_index, time_col_index
+        )
+    else:
+        t1 = float(rdf.loc[rdf[compute_element_col_index] == 1][time_col_index].iloc[0])
+
+    # speedup n = t1 / tn
+    speedup = t1 / rdf[time_col_index]
+
+    # strong scaling efficiency n = t1 / (tn * n)
+    strong_efficiency = t1 / (rdf[time_col_index] * rdf[compute_element_col_index])
+
+    # weak scaling efficiency n = t1 / tn
+    weak_efficiency = t1 / rdf[time_col_index]
+
+    return (speedup, strong_efficiency, weak_efficiency)
+
+
+def baseline_walltime(
+    rdf,
+    group_cols=("group",),
+    compute_element_col="compute_elements",
+    time_col="walltime",
+):
+    """Finds the single compute element walltime for every row of a dataframe
+
+    rdf: the results dataframe, with at most one row for each group and
+        compute element count
+    group_cols: the columns that together identify a result group
+    compute_element_col: compute elements column name
+    time_col: column name containing the computation times
+
+    Returns: a series aligned with rdf containing the t1 value of each row's
+    group. Groups without a 1 compute element entry get NaN.
+    """
+    t1_only = rdf[time_col].where(rdf[compute_element_col] == 1)
+    return t1_only.groupby([rdf[c] for c in group_cols]).transform("max")
+
+
+def calculate_cost_metrics(
+    rdf,
+    group_cols=("group",),
+    compute_element_col="compute_elements",
+    time_col="walltime",
+    seconds_per_time_unit=60.0,
+    work_units=1.0,
+    core_hour_cost=1.0,
+):
+    """Calculates the hardware normalised and cost metrics for every row of a
+    results dataframe
+
+    rdf: the aggregated results dataframe
+    group_cols: the columns that together identify a result group
+    compute_element_col: compute elements column name
+    time_col: column name containing the computation times
+    seconds_per_time_unit: number of seconds in one walltime unit
+    work_units: amount of work completed by a single run
+    core_hour_cost: cost of a single core hour
+
+    The optional columns named by NODES_COLUMN, CORES_PER_NODE_COLUMN,
+    ENERGY_COLUMN and MEMORY_COLUMN are used when they are present. The core
+    count of a run is nodes * cores_per_node if both are given, otherwise the
+    number of compute elements.
+
+    Returns: a dataframe aligned with rdf, with one column for each of the
+    COST_METRICS that could be calculated
+    """
+    metrics = rdf[[]].copy()
+    seconds = rdf[time_col] * seconds_per_time_unit
+    elements = rdf[compute_element_col]
+
+    if NODES_COLUMN in rdf and CORES_PER_NODE_COLUMN in rdf:
+        cores = rdf[NODES_COLUMN] * rdf[CORES_PER_NODE_COLUMN]
+    else:
+        cores = elements
+
+    metrics["throughput"] = work_units / seconds
+    metrics["core_hours"] = cores * seconds / 3600.0
+    metrics["cost"] = metrics.core_hours * core_hour_cost
+
+    if ENERGY_COLUMN in rdf:
+        metrics["energy_efficiency"] = work_units / rdf[ENERGY_COLUMN].replace(
+            0, np.nan
+        )
+
+    # parallel overhead n = n * tn - t1
+    t1 = baseline_walltime(rdf, group_cols, compute_element_col, time_col)
+    metrics["parallel_overhead"] = elements * rdf[time_col] - t1
+
+    if MEMORY_COLUMN in rdf:
+        metrics["memory_per_element"] = rdf[MEMORY_COLUMN] / elements
+
+    return metrics
+
+
+def derive_weak_scaling(
+    rdf,
+    size_col,
+    group_cols=("group",),
+    compute_element_col="compute_elements",
+    time_col="walltime",
+):
+    """Derives weak scaling curves from a sweep over problem sizes by pairing
+    each problem size with a compute element count
+
+    A weak scaling curve is made from the runs of a result group that have
+    the same problem size per compute element. Each curve is compared to its
+    own 1 compute element run.
+
+    rdf: the aggregated results dataframe
+    size_col: column containing the problem size
+    group_cols: the columns, other than size_col, that together identify a
+        result group
+    compute_element_col: compute elements column name
+    time_col: column name containing the computation times
+
+    Returns: a copy of the rows that belong to a weak scaling curve, with
+    added size_per_element and weak_efficiency columns. Curves without a 1
+    compute element run, or with only a single run, are dropped.
+    """
+    weak = rdf.copy()
+    weak["size_per_element"] = weak[size_col] / weak[compute_element_col]
+
+    curve_cols = list(group_cols) + ["size_per_element"]
+    t1 = baseline_walltime(weak, curve_cols, compute_element_col, time_col)
+
+    # weak scaling efficiency n = t1 / tn
+    weak["weak_efficiency"] = t1 / weak[time_col]
+
+    runs = weak[time_col].groupby([weak[c] for c in curve_cols]).transform("size")
+    return weak[t1.notnull() & (runs > 1)]
+
+
+def recommend_concurrency(
+    rdf,
+    threshold=0.7,
+    project_count=None,
+    series_col="series",
+    compute_element_col="compute_elements",
+    time_col="walltime",
+    efficiency_col="strong_efficiency",
+):
+    """Recommends a compute element count for every result group
+
+    The measured efficiency curves of all groups are searched at once, as a
+    2D array with one row per group and one column per compute element count.
+    The knee is where the efficiency first drops below the threshold,
+    linearly interpolated between the neighbouring measurements. The
+    recommended count is the largest measured count before the knee.
+
+    Time to solution is projected by fitting Amdahl's law,
+    tn / t1 = s + (1 - s) / n, to each group's walltimes, with the serial
+    fraction s found by least squares.
+
+    rdf: the aggregated results dataframe, with one row for each group and
+        compute element count
+    threshold: the minimum acceptable efficiency
+    project_count: optional compute element count to project the walltime,
+        speedup and efficiency for
+    series_col: column identifying each result group
+    compute_element_col: compute elements column name
+    time_col: column name containing the computation times
+    efficiency_col: column name containing the efficiencies
+
+    Returns: a dataframe indexed by result group, with columns
+    recommended, recommended_speedup, recommended_efficiency, knee,
+    serial_fraction and max_speedup, plus projected_walltime,
+    projected_speedup and projected_efficiency if project_count is given.
+    Values that cannot be calculated are NaN.
+    """
+    walltimes = rdf.pivot(
+        index=series_col, columns=compute_element_col, values=time_col
+    )
+    efficiency = rdf.pivot(
+        index=series_col, columns=compute_element_col, values=efficiency_col
+    ).reindex_like(walltimes)
+
+    n = walltimes.columns.to_numpy(dtype=float)
+    t = walltimes.to_numpy(dtype=float)
+    e = efficiency.to_numpy(dtype=float)
+    rows = np.arange(len(e))
+
+    # the single compute element walltime of each group
+    if (n == 1).any():
+        t1 = t[:, np.argmax(n == 1)]
+    else:
+        t1 = np.full(len(t), np.nan)
+
+    # index of the last measured count at or before each column
+    valid = ~np.isnan(e)
+    last_valid = np.maximum.accumulate(
+        np.where(valid, np.arange(e.shape[1]), -1), axis=1
+    )
+
+    # the first measured count below the threshold
+    below = valid & (e < threshold)
+    has_drop = below.any(axis=1)
+    drop = below.argmax(axis=1)
+    before = np.where(
+        has_drop, last_valid[rows, np.maximum(drop - 1, 0)], last_valid[:, -1]
+    )
+    before = np.where(has_drop & (drop == 0), -1, before)
+    found = before >= 0
+    safe_before = np.maximum(before, 0)
+
+    recommended = np.where(found, n[safe_before], np.nan)
+    recommended_efficiency = np.where(found, e[rows, safe_before], np.nan)
+    recommended_speedup = np.where(found, t1 / t[rows, safe_before], np.nan)
+
+    # interpolate the count where the efficiency crosses the threshold
+    e0, e1 = recommended_efficiency, e[rows, drop]
+    n0, n1 = recommended, n[drop]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        knee = np.where(
+            has_drop & found, n0 + (e0 - threshold) / (e0 - e1) * (n1 - n0), np.nan
+        )
+
+    # least squares fit of the serial fraction, using x = 1 / n:
+    # tn / t1 - x = s * (1 - x)
+    x = 1.0 / n
+    y = t / t1[:, np.newaxis]
+    fit = ~np.isnan(y) & (n > 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        serial_fraction = np.clip(
+            np.where(fit, (y - x) * (1 - x), 0).sum(axis=1)
+            / np.where(fit, (1 - x) ** 2, 0).sum(axis=1),
+            0,
+            1,
+        )
+        max_speedup = 1 / serial_fraction
+
+    recommendations = pd.DataFrame(
+        {
+            "recommended": recommended,
+            "recommended_speedup": recommended_speedup,
+            "recommended_efficiency": recommended_efficiency,
+            "knee": knee,
+            "serial_fraction": serial_fraction,
+            "max_speedup": max_speedup,
+        },
+        index=walltimes.index,
+    )
+
+    if project_count:
+        relative_time = serial_fraction + (1 - serial_fraction) / project_count
+        recommendations["projected_walltime"] = t1 * relative_time
+        recommendations["projected_speedup"] = 1 / relative_time
+        recommendations["projected_efficiency"] = 1 / (relative_time * project_count)
+
+    return recommendations
+
+
+def _outlier_scores(times, method, min_spread):
+    """scores each run in a set of cells against the other runs in its cell
+
+    times: (cells, runs) array of the walltimes of cells with the same number
+        of runs, at least 3
+    method: one of the OUTLIER_THRESHOLDS methods
+    min_spread: the smallest spread, as a fraction of the centre of the other
+        runs
+
+    Returns: (cells, runs) array of scores
+    """
+    run_count = times.shape[1]
+
+    # others[:, i] holds every run in the cell except run i
+    leave_one_out = np.array(
+        [[j for j in range(run_count) if j != i] for i in range(run_count)]
+    )
+    others = times[:, leave_one_out]
+
+    if method == "mad":
+        centre = np.median(others, axis=2)
+        spread = np.median(np.abs(others - centre[..., np.newaxis]), axis=2)
+        deviation = 0.6745 * np.abs(times - centre)
+    elif method == "iqr":
+        q1, centre, q3 = np.quantile(others, [0.25, 0.5, 0.75], axis=2)
+        spread = q3 - q1
+        deviation = np.maximum(q1 - times, times - q3)
+    else:
+        centre = others.mean(axis=2)
+        spread = others.std(axis=2, ddof=1)
+        deviation = np.abs(times - centre)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return deviation / np.maximum(spread, min_spread * np.abs(centre))
+
+
+def flag_outliers(
+    rdf,
+    method="mad",
+    threshold=None,
+    cell_cols=("group", "compute_elements"),
+    time_col="walltime",
+    min_runs=3,
+    min_spread=OUTLIER_MIN_SPREAD,
+):
+    """Flags outlying runs, such as stragglers caused by bad nodes or
+    filesystem stalls, before the runs are averaged
+
+    Each run is scored against the other runs in the same cell, leaving the
+    run itself out so that a straggler cannot inflate the spread that is
+    meant to catch it. The cells with the same number of runs are scored
+    together as one array, rather than looping over the cells.
+
+    rdf: the unaggregated results dataframe
+    method: one of the OUTLIER_THRESHOLDS methods
+        mad: distance from the median of the other runs, in units of their
+            median absolute deviation, scaled by 0.6745
+        iqr: distance outside the quartiles of the other runs, in units of
+            their interquartile range
+        zscore: distance from the mean of the other runs, in units of their
+            standard deviation
+    threshold: the method threshold. Defaults to OUTLIER_THRESHOLDS[method]
+    cell_cols: the columns that together identify a cell of repeated runs
+    time_col: column name containing the computation times
+    min_runs: cells with fewer runs than this are never flagged. Scoring a
+        run needs at least 2 other runs, so values below 3 act as 3.
+    min_spread: the smallest spread of the other runs, as a fraction of their
+        median or mean. Defaults to OUTLIER_MIN_SPREAD.
+
+    Returns: a boolean series aligned with rdf, True for the outlying runs
+    """
+    if method not in OUTLIER_THRESHOLDS:
+        raise ValueError("Unknown outlier method '{0}'".format(method))
+    if threshold is None:
+        threshold = OUTLIER_THRESHOLDS[method]
+
+    times = rdf[time_col].to_numpy(dtype=float)
+    cells = rdf.groupby(list(cell_cols), dropna=False)
+    sizes = cells[time_col].transform("size").to_numpy()
+    cell_ids = cells.ngroup().to_numpy()
+    positions = cells.cumcount().to_numpy()
+
+    # score the cells with the same number of runs together, as one
+    # (cells, runs) array
+    scores = np.zeros(len(rdf))
+    for run_count in np.unique(sizes[sizes >= max(min_runs, 3)]):
+        rows = sizes == run_count
+        _, cell_rows = np.unique(cell_ids[rows], return_inverse=True)
+        cell_times = np.empty((cell_rows.max() + 1, run_count))
+        cell_times[cell_rows, positions[rows]] = times[rows]
+        scores[rows] = _outlier_scores(cell_times, method, min_spread)[
+            cell_rows, positions[rows]
+        ]
+
+    return pd.Series(scores > threshold, index=rdf.index)
@@ -7,6 +7,21 @@ import matplotlib
 import matplotlib.pyplot as plt
 import argparse
 
+from scaling_metrics import (
+    COST_METRICS,
+    CORES_PER_NODE_COLUMN,
+    ENERGY_COLUMN,
+    MEMORY_COLUMN,
+    NODES_COLUMN,
+    OUTLIER_THRESHOLDS,
+    calculate_cost_metrics,
+    calculate_speedup_and_efficiency,
+    derive_weak_scaling,
+    flag_outliers,
+    recommend_concurrency,
+)
+from scaling_report import write_html_report
+
 # CSIRO colours
 COLOURS = [
     "#00a9ce",  # midday blue
@@ -20,6 +35,18 @@ COLOURS = [
     "#1E22AA",  # blueberry
 ]
 
+# Seconds in each recognised --walltime_units name, singular and lower case
+SECONDS_PER_WALLTIME_UNIT = {
+    "s": 1.0,
+    "sec": 1.0,
+    "second": 1.0,
+    "min": 60.0,
+    "minute": 60.0,
+    "h": 3600.0,
+    "hr": 3600.0,
+    "hour": 3600.0,
+}
+
 
 def get_args():
     """Gets the command line arguments"""
@@ -30,8 +57,10 @@ def get_args():
     parser.add_argument(
         "--worksheet_name",
         type=str,
-        default="results",
-        help="Worksheet containing the results to plot",
+        nargs="+",
+        default=["results"],
+        help="""Worksheet containing the results to plot. If more than one
+        worksheet is given, a separate set of plots is made for each.""",
     )
     parser.add_argument(
         "--compute_element_name",
@@ -74,6 +103,13 @@ def get_args():
         help="prints plots to a window instead of to files",
         action="store_true",
     )
+    parser.add_argument(
+        "--per_group",
+        default=False,
+        help="""Make a separate set of plots for each result group, instead of
+        plotting all of the groups together""",
+        action="store_true",
+    )
     parser.add_argument(
         "--plot_width", default=10, type=int, help="Plot width in inches"
     )
@@ -98,11 +134,178 @@ def get_args():
         help="Apply the matplotlib tight_layout for smaller margins than the default.",
         action="store_true",
     )
+    parser.add_argument(
+        "--nodes_column",
+        default="",
+        type=str,
+        help="Optional column containing the number of nodes used by each run",
+    )
+    parser.add_argument(
+        "--cores_per_node_column",
+        default="",
+        type=str,
+        help="""Optional column containing the number of cores per node. If both
+        the nodes and cores per node columns are given they are used for the
+        core hour calculations, otherwise the number of compute elements is
+        used.""",
+    )
+    parser.add_argument(
+        "--energy_column",
+        default="",
+        type=str,
+        help="Optional column containing the energy used by each run, in joules",
+    )
+    parser.add_argument(
+        "--memory_column",
+        default="",
+        type=str,
+        help="Optional column containing the memory high-water mark of each run",
+    )
+    parser.add_argument(
+        "--seconds_per_walltime_unit",
+        default=None,
+        type=float,
+        help="""Number of seconds in one walltime unit. Used for the cost
+        metrics. Defaults to the number of seconds in --walltime_units, which
+        must then be seconds, minutes or hours.""",
+    )
+    parser.add_argument(
+        "--work_units",
+        default=1.0,
+        type=float,
+        help="Amount of work completed by a single run. Used for the throughput "
+        "and energy efficiency metrics",
+    )
+    parser.add_argument(
+        "--core_hour_cost",
+        default=1.0,
+        type=float,
+        help="Cost of a single core hour. Used for the cost per run metric",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=[],
+        nargs="*",
+        choices=sorted(COST_METRICS),
+        help="""Optional cost metrics to plot. Metrics that need a missing
+        optional column are skipped.""",
+    )
+    parser.add_argument(
+        "--dimensions",
+        default=[],
+        nargs="*",
+        help="""Optional extra sweep dimension columns, such as problem size or
+        compiler flags. Results are averaged and compared to their 1 compute
+        element baseline separately for each combination of group and
+        dimension values.""",
+    )
+    parser.add_argument(
+        "--facet_rows",
+        default="",
+        type=str,
+        help="""Optional dimension mapped to the rows of a grid of speedup and
+        efficiency plots, rendered as a single figure""",
+    )
+    parser.add_argument(
+        "--facet_columns",
+        default="",
+        type=str,
+        help="""Optional dimension mapped to the columns of a grid of speedup
+        and efficiency plots, rendered as a single figure""",
+    )
+    parser.add_argument(
+        "--weak_size_column",
+        default="",
+        type=str,
+        help="""Optional problem size dimension. If given, weak scaling curves
+        are derived by pairing runs that have the same problem size per
+        compute element.""",
+    )
+
+    parser.add_argument(
+        "--html_report",
+        default=False,
+        help="""Also write an interactive HTML report for each worksheet. The
+        report is a single self contained file that can be viewed offline.""",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no_plots",
+        default=False,
+        help="Skip the matplotlib plots. Useful with --html_report",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--recommend",
+        default=False,
+        help="""Print a recommended compute element count for each group and
+        mark it on the speedup and efficiency plots. The recommendation is
+        the largest measured count before the efficiency drops below
+        --efficiency_threshold.""",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--efficiency_threshold",
+        default=0.7,
+        type=float,
+        help="Minimum acceptable efficiency for the recommendations",
+    )
+    parser.add_argument(
+        "--project_count",
+        default=None,
+        type=int,
+        help="""Optional compute element count to project the walltime,
+        speedup and efficiency for, using a fit of Amdahl's law. Only used
+        for strong scaling with --recommend.""",
+    )
+
+    parser.add_argument(
+        "--outliers",
+        default="none",
+        choices=["none"] + sorted(OUTLIER_THRESHOLDS),
+        help="""Drop runs that are far from the other runs in their group and
+        compute element cell, in units of the median absolute deviation
+        (mad), interquartile range (iqr) or standard deviation (zscore) of
+        the other runs, before averaging.""",
+    )
+    parser.add_argument(
+        "--outlier_threshold",
+        default=None,
+        type=float,
+        help="""Threshold for the outlier method. Defaults to 30, which leaves
+        clean cells of 3 to 5 runs alone.""",
+    )
+    parser.add_argument(
+        "--mark_outliers",
+        default=False,
+        help="Mark the dropped outlier runs on the walltime plot",
+        action="store_true",
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    for column in (args.facet_rows, args.facet_columns, args.weak_size_column):
+        if column and column not in args.dimensions:
+            parser.error("'{0}' must also be given in --dimensions".format(column))
+    if args.mark_outliers and args.outliers == "none":
+        parser.error("--mark_outliers needs an --outliers method")
+
+    # derive the seconds per walltime unit from the units name
+    if args.seconds_per_walltime_unit is None:
+        units = args.walltime_units.strip().lower()
+        if units not in SECONDS_PER_WALLTIME_UNIT and units.endswith("s"):
+            units = units[:-1]
+        args.seconds_per_walltime_unit = SECONDS_PER_WALLTIME_UNIT.get(units, np.nan)
+        if args.metrics and np.isnan(args.seconds_per_walltime_unit):
+            parser.error(
+                "unknown --walltime_units '{0}', give --seconds_per_walltime_unit "
+                "for the cost metrics".format(args.walltime_units)
+            )
 
+    return args
 
-def save(path, ext="png", close=True, verbose=True):
+
+def save(path, ext="png", close=True, verbose=True, fig=None):
     """Save a figure from pyplot.
 
     Parameters
@@ -126,6 +329,9 @@ def save(path, ext="png", close=True, verbose=True):
         Whether to print information about when and where the image
         has been saved.
 
+    fig : matplotlib Figure (default=None)
+        The figure to save. If None, the current pyplot figure is saved.
+
     """
 
     # Extract the directory and filename from the given path
@@ -145,11 +351,13 @@ def save(path, ext="png", close=True, verbose=True):
         print("Saving figure to '%s'..." % savepath),
 
     # Actually save the figure
-    plt.savefig(savepath)
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(savepath)
 
     # Close it
     if close:
-        plt.close()
+        plt.close(fig)
 
     if verbose:
         print("Done")
@@ -165,30 +373,9 @@ def read_dataframe_from_excel(filename, worksheet, **kwargs):
     return results
 
 
-def calculate_speedup_and_efficiency(rdf, compute_element_col_index, time_col_index):
-    """Calculates the speedup and efficiency and
-    adds them as new columns to a dataframe
-
-    rdf: the results dataframe
-    compute_element_col_index: compute elements column name
-    time_col_index: column name containing the computation times
-
-    Returns: a tuple containing the speedup, strong scaling efficiency, and
-    weak scaling efficiency series
-    """
-    # get the t1 reference value
-    t1 = float(rdf.loc[rdf[compute_element_col_index] == 1][time_col_index])
-
-    # speedup n = t1 / tn
-    speedup = t1 / rdf[time_col_index]
-
-    # strong scaling efficiency n = t1 / (tn * n)
-    strong_efficiency = t1 / (rdf[time_col_index] * rdf[compute_element_col_index])
-
-    # weak scaling efficiency n = t1 / tn
-    weak_efficiency = t1 / rdf[time_col_index]
-
-    return (speedup, strong_efficiency, weak_efficiency)
+def cycle_colours(count, colours=COLOURS):
+    """Returns a list of count colours, repeating the colours if needed"""
+    return [colours[i % len(colours)] for i in range(count)]
 
 
 def add_sorted_legend(ax, face_color=None):
@@ -206,6 +393,263 @@ def add_sorted_legend(ax, face_color=None):
         ax.get_legend().get_frame().set_facecolor(face_color)
 
 
+class WalltimePlotTemplate:
+    """A reusable grouped bar plot figure.
+
+    The figure, axes and axis labels are created once. Each call to update
+    swaps in the bar heights of a new dataset, so that many figures with the
+    same layout can be saved without rebuilding the figure every time.
+    """
+
+    def __init__(
+        self,
+        plot_size=None,
+        group_width=0.8,
+        xlabel="Processes",
+        ylabel="Minutes",
+        y_log_scale=False,
+    ):
+        self.fig = plt.figure(figsize=plot_size)
+        self.ax = self.fig.add_subplot(111)
+        self.group_width = group_width
+        self.y_log_scale = y_log_scale
+        self.bars = []
+        self._layout = None
+
+        # optional markers for the runs that were dropped as outliers
+        self.outlier_markers = self.ax.scatter(
+            [], [], marker="x", color="black", zorder=3, label="_nolegend_"
+        )
+
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+
+    def update(
+        self,
+        series,
+        colours,
+        series_names,
+        compute_elements,
+        ymax,
+        ymin=0,
+        title="Walltime",
+        outliers=None,
+    ):
+        """replaces the plotted data with a new set of series
+
+        ymin: the bottom of the y axis, below zero for metrics that can be
+            negative
+        outliers: optional (compute elements, walltimes) pair of sequences for
+            each series, marking the individual runs that were dropped
+        """
+
+        # the x locations for the groups.
+        x_ind = np.arange(len(compute_elements))
+
+        # the bars only need to be rebuilt when the number of bars changes
+        layout = (len(series), len(compute_elements))
+        if layout != self._layout:
+            self._create_bars(series, colours, series_names, x_ind)
+            self._layout = layout
+
+            plot_left = x_ind[0] - self.group_width
+            plot_right = x_ind[-1] + self.group_width
+            self.ax.set_xlim(plot_left, plot_right)
+            self.ax.set_xticks(x_ind)
+        else:
+            for bars, values, colour, name in zip(
+                self.bars, series, colours, series_names
+            ):
+                for bar, value in zip(bars, values):
+                    bar.set_height(value)
+                    bar.set_facecolor(colour)
+                bars.set_label(name)
+
+        self._mark_outliers(outliers, compute_elements, x_ind, len(series))
+
+        self.ax.set_title(title)
+        self.ax.set_ylim(ymin, ymax)
+        self.ax.set_xticklabels(compute_elements)
+
+        add_sorted_legend(self.ax)
+
+    def _mark_outliers(self, outliers, compute_elements, x_ind, bars_per_group):
+        offsets = np.empty((0, 2))
+        if outliers:
+            # place each marker on the bar of its series and compute element
+            bar_width = self.group_width / bars_per_group
+            offsets = np.concatenate(
+                [
+                    np.column_stack(
+                        (
+                            x_ind[np.searchsorted(compute_elements, x)]
+                            - self.group_width / 2
+                            + i * bar_width,
+                            y,
+                        )
+                    )
+                    for i, (x, y) in enumerate(outliers)
+                ]
+            )
+        self.outlier_markers.set_offsets(offsets)
+        self.outlier_markers.set_label(
+            "Dropped outliers" if len(offsets) else "_nolegend_"
+        )
+
+    def _create_bars(self, series, colours, series_names, x_ind):
+        for bars in self.bars:
+            bars.remove()
+        self.bars = []
+
+        # create the individual bars
+        bars_per_group = len(series)
+        bar_width = self.group_width / bars_per_group
+        bar_left = x_ind - (self.group_width / 2)  # centre the group on the ticks
+
+        for values, colour, name in zip(series, colours, series_names):
+            self.bars.append(
+                self.ax.bar(
+                    bar_left,
+                    values,
+                    width=bar_width,
+                    color=colour,
+                    label=name,
+                    log=self.y_log_scale,
+                )
+            )
+            bar_left += bar_width
+
+
+class LinePlotTemplate:
+    """A reusable line plot figure with a red ideal scaling reference line.
+
+    reference: "speedup" for the diagonal ideal speedup line, or
+        "efficiency" for the horizontal ideal efficiency line.
+
+    As with WalltimePlotTemplate, the static parts of the figure are created
+    once and update only replaces the line data.
+    """
+
+    def __init__(
+        self,
+        reference="speedup",
+        line_width=1,
+        plot_size=None,
+        xlabel="Processes",
+        ylabel="Speedup",
+    ):
+        self.fig = plt.figure(figsize=plot_size)
+        self.ax = self.fig.add_subplot(111)
+        self.reference = reference
+        self.line_width = line_width
+        self.lines = []
+        self._compute_elements = None
+
+        # create the ideal speedup or efficiency reference line
+        (self.reference_line,) = self.ax.plot(
+            [], [], color="red", linewidth=line_width, label="_nolegend_"
+        )
+
+        # optional efficiency threshold line and recommended count markers
+        self.threshold_line = self.ax.axhline(
+            0,
+            color="grey",
+            linestyle="dashed",
+            linewidth=line_width,
+            label="_nolegend_",
+            visible=False,
+        )
+        self.markers = self.ax.scatter(
+            [], [], marker="*", s=200, zorder=3, edgecolors="black", label="_nolegend_"
+        )
+
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+
+    def update(
+        self,
+        series,
+        colours,
+        series_names,
+        compute_elements,
+        xmax,
+        ymax,
+        ymin=0,
+        title="Speedup",
+        x_series=None,
+        annotations=None,
+        threshold=None,
+    ):
+        """replaces the plotted data with a new set of series
+
+        x_series: optional compute element counts for each series, for series
+            that do not have a value for every compute element count
+        annotations: optional (x, y) point for each series, such as the
+            recommended compute element count, marked with a star
+        threshold: optional efficiency threshold, drawn as a dashed line
+        """
+
+        # define the sizes and locations of things
+        x_ticks = list(compute_elements)
+        x_ticks.append(xmax)
+        plot_left = x_ticks[0]
+        plot_right = x_ticks[-1]
+        self.ax.set_xlim(plot_left, plot_right)
+        self.ax.set_ylim(ymin, ymax)
+
+        if self.reference == "speedup":
+            self.reference_line.set_data(x_ticks, x_ticks)
+        else:
+            self.reference_line.set_data([plot_left, plot_right], [1, 1])
+
+        # reuse the existing lines, adding or removing lines as needed
+        while len(self.lines) > len(series):
+            self.lines.pop().remove()
+        while len(self.lines) < len(series):
+            (line,) = self.ax.plot(
+                [], [], linewidth=self.line_width, marker="o", label="_nolegend_"
+            )
+            self.lines.append(line)
+
+        if x_series is None:
+            x_series = [compute_elements] * len(series)
+
+        for line, x_values, values, colour, name in zip(
+            self.lines, x_series, series, colours, series_names
+        ):
+            line.set_data(x_values, values)
+            line.set_color(colour)
+            line.set_label(name)
+
+        if annotations is None:
+            annotations = []
+        self.markers.set_offsets(np.reshape(annotations, (-1, 2)))
+        self.markers.set_facecolor(colours[: len(annotations)])
+
+        self.threshold_line.set_visible(threshold is not None)
+        if threshold is not None:
+            self.threshold_line.set_ydata([threshold, threshold])
+
+        # apply the labels and formatting
+        if not np.array_equal(compute_elements, self._compute_elements):
+            self.ax.set_xticks(compute_elements)
+            self.ax.set_xticklabels(compute_elements)
+            self._compute_elements = np.array(compute_elements)
+        self.ax.set_title(title)
+
+        add_sorted_legend(self.ax)
+
+
+def show_or_save(fig, file_name, file_extension="png", show=False, close=True):
+    """shows a figure in a window, or saves it to a file"""
+    if show:
+        plt.show()
+    else:
+        if args.tight:
+            fig.tight_layout()
+        save(file_name, file_extension, close=close, verbose=True, fig=fig)
+
+
 def plot_walltime(
     series,
     colours,
@@ -221,46 +665,15 @@ def plot_walltime(
     file_extension="png",
     y_log_scale=False,
     show=False,
+    outliers=None,
+    ymin=0,
 ):
     """creates a bar plot as a new pyplot figure"""
-
-    # the x locations for the groups.
-    x_ind = np.arange(len(compute_elements))
-
-    # create the figure and axes
-    fig = plt.figure(figsize=plot_size)
-    ax = fig.add_subplot(111)
-
-    # create the individual bars
-    bars_per_group = len(series)
-    bar_width = group_width / bars_per_group
-    bar_left = x_ind - (group_width / 2)  # centre the group on the ticks
-    plot_left = x_ind[0] - group_width
-    plot_right = x_ind[-1] + group_width
-
-    for values, colour, name in zip(series, colours, series_names):
-        ax.bar(
-            bar_left, values, width=bar_width, color=colour, label=name, log=y_log_scale
-        )
-        bar_left += bar_width
-
-    # apply the labels and formatting
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    ax.set_title(title)
-    ax.set_xlim(plot_left, plot_right)
-    ax.set_ylim(0, ymax)
-    ax.set_xticks(x_ind)
-    ax.set_xticklabels(compute_elements)
-
-    add_sorted_legend(ax)
-
-    if show:
-        plt.show()
-    else:
-        if args.tight:
-            plt.tight_layout()
-        save(file_name, file_extension, close=True, verbose=True)
+    template = WalltimePlotTemplate(plot_size, group_width, xlabel, ylabel, y_log_scale)
+    template.update(
+        series, colours, series_names, compute_elements, ymax, ymin, title, outliers
+    )
+    show_or_save(template.fig, file_name, file_extension, show)
 
 
 def plot_speedup(
@@ -278,50 +691,22 @@ def plot_speedup(
     file_name="speedup",
     file_extension="png",
     show=False,
+    annotations=None,
 ):
     """creates a speedup plot"""
-
-    # create the figure and axes
-    fig = plt.figure(figsize=plot_size)
-    ax = fig.add_subplot(111)
-
-    # define the sizes and locations of things
-    x_ticks = list(compute_elements)
-    x_ticks.append(xmax)
-    plot_left = x_ticks[0]
-    plot_right = x_ticks[-1]
-    ax.set_xlim(plot_left, plot_right)
-    ax.set_ylim(plot_left, ymax)
-
-    # create the ideal speedup reference line
-    ax.plot(x_ticks, x_ticks, color="red", linewidth=line_width, label="_nolegend_")
-
-    # plot each series
-    for values, colour, name in zip(series, colours, series_names):
-        ax.plot(
-            compute_elements,
-            values,
-            label=name,
-            color=colour,
-            linewidth=line_width,
-            marker="o",
-        )
-
-    # apply the labels and formatting
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    ax.set_title(title)
-    ax.set_xticks(compute_elements)
-    ax.set_xticklabels(compute_elements)
-
-    add_sorted_legend(ax)
-
-    if show:
-        plt.show()
-    else:
-        if args.tight:
-            plt.tight_layout()
-        save(file_name, file_extension, close=True, verbose=True)
+    template = LinePlotTemplate("speedup", line_width, plot_size, xlabel, ylabel)
+    template.update(
+        series,
+        colours,
+        series_names,
+        compute_elements,
+        xmax,
+        ymax,
+        ymin=compute_elements[0],
+        title=title,
+        annotations=annotations,
+    )
+    show_or_save(template.fig, file_name, file_extension, show)
 
 
 def plot_efficiency(
@@ -339,67 +724,302 @@ def plot_efficiency(
     file_name="efficiency",
     file_extension="png",
     show=False,
+    x_series=None,
+    annotations=None,
+    threshold=None,
 ):
     """creates an efficiency plot"""
+    template = LinePlotTemplate("efficiency", line_width, plot_size, xlabel, ylabel)
+    template.update(
+        series,
+        colours,
+        series_names,
+        compute_elements,
+        xmax,
+        ymax,
+        title=title,
+        x_series=x_series,
+        annotations=annotations,
+        threshold=threshold,
+    )
+    show_or_save(template.fig, file_name, file_extension, show)
 
-    # create the figure and axes
-    fig = plt.figure(figsize=plot_size)
-    ax = fig.add_subplot(111)
+
+def plot_facets(
+    results,
+    dimensions,
+    row_dimension,
+    column_dimension,
+    colours,
+    speedup_max,
+    weak=False,
+    line_width=1,
+    facet_size=None,
+    xlabel="Processes",
+    title="Scaling",
+    file_name="facets",
+    file_extension="png",
+    show=False,
+):
+    """creates a grid of speedup and efficiency plots as a single figure
+
+    results: the aggregated results dataframe, for all groups and dimensions
+    dimensions: the extra sweep dimension columns
+    row_dimension: optional dimension mapped to the grid rows
+    column_dimension: optional dimension mapped to the grid columns. Each
+        column value has a speedup and an efficiency plot, or only a weak
+        scaling efficiency plot if weak is True.
+    facet_size: the size of each plot in the grid, in inches
+
+    Series are labelled by the group and the dimensions that are not mapped
+    to the grid.
+    """
+    facet_cols = [d for d in (row_dimension, column_dimension) if d]
+    row_values = sorted(results[row_dimension].unique()) if row_dimension else [None]
+    column_values = (
+        sorted(results[column_dimension].unique()) if column_dimension else [None]
+    )
+    if weak:
+        metrics = [("weak_efficiency", "Efficiency")]
+    else:
+        metrics = [("speedup", "Speedup"), ("strong_efficiency", "Efficiency")]
+
+    nrows = len(row_values)
+    ncols = len(column_values) * len(metrics)
+    figsize = None
+    if facet_size:
+        figsize = (facet_size[0] * ncols, facet_size[1] * nrows)
+    fig, axes = plt.subplots(nrows, ncols, figsize=figsize, sharex=True, squeeze=False)
 
     # define the sizes and locations of things
+    compute_elements = np.sort(results.compute_elements.unique())
     x_ticks = list(compute_elements)
-    x_ticks.append(xmax)
+    x_ticks.append(compute_elements.max() * 1.05)
     plot_left = x_ticks[0]
     plot_right = x_ticks[-1]
-    ax.set_xlim(plot_left, plot_right)
-    ax.set_ylim(0, ymax)
-
-    # create a horizontal ideal efficiency reference line
-    ax.hlines(
-        1,
-        plot_left,
-        plot_right,
-        colors="red",
-        linestyles="solid",
-        linewidth=line_width,
-        label="_nolegend_",
-    )
-
-    # plot each series
-    for values, colour, name in zip(series, colours, series_names):
-        ax.plot(
-            compute_elements,
-            values,
-            label=name,
-            color=colour,
-            linewidth=line_width,
-            marker="o",
-        )
 
-    # apply the labels and formatting
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    ax.set_title(title)
-    ax.set_xticks(compute_elements)
-    ax.set_xticklabels(compute_elements)
+    # the static formatting and reference lines of each facet
+    for r, row_value in enumerate(row_values):
+        for c, column_value in enumerate(column_values):
+            facet_label = ", ".join(
+                "{0}={1}".format(d, v)
+                for d, v in (
+                    (row_dimension, row_value),
+                    (column_dimension, column_value),
+                )
+                if d
+            )
+            for m, (metric, ylabel) in enumerate(metrics):
+                ax = axes[r, c * len(metrics) + m]
+                ax.set_xlim(plot_left, plot_right)
+                if metric == "speedup":
+                    ax.set_ylim(plot_left, speedup_max)
+                    ax.plot(
+                        x_ticks,
+                        x_ticks,
+                        color="red",
+                        linewidth=line_width,
+                        label="_nolegend_",
+                    )
+                else:
+                    ax.set_ylim(0, 1.3)
+                    ax.hlines(
+                        1,
+                        plot_left,
+                        plot_right,
+                        colors="red",
+                        linestyles="solid",
+                        linewidth=line_width,
+                        label="_nolegend_",
+                    )
+                ax.set_title(facet_label, fontsize="small")
+                ax.set_ylabel(ylabel)
+                ax.set_xticks(compute_elements)
+                ax.set_xticklabels(compute_elements)
+                if r == nrows - 1:
+                    ax.set_xlabel(xlabel)
+
+    # plot each series, in a single pass over the facets and series
+    series_cols = ["group"] + [d for d in dimensions if d not in facet_cols]
+    labels = label_series(results, series_cols)
+    series_names = sorted(labels.unique())
+    series_colours = dict(zip(series_names, cycle_colours(len(series_names), colours)))
+    for keys, data in results.groupby(facet_cols + [labels]):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        name = keys[-1]
+        r = row_values.index(keys[0]) if row_dimension else 0
+        c = column_values.index(keys[-2]) if column_dimension else 0
+        data = data.sort_values(by="compute_elements")
+        for m, (metric, ylabel) in enumerate(metrics):
+            axes[r, c * len(metrics) + m].plot(
+                data.compute_elements,
+                data[metric],
+                label=name,
+                color=series_colours[name],
+                linewidth=line_width,
+                marker="o",
+            )
 
-    add_sorted_legend(ax)
+    # a single legend for the whole grid
+    handles = {}
+    for ax in axes.flat:
+        for handle, label in zip(*ax.get_legend_handles_labels()):
+            handles.setdefault(label, handle)
+    names = sorted(handles)
+    axes[0, -1].legend([handles[n] for n in names], names, fontsize="small")
 
-    if show:
-        plt.show()
-    else:
-        if args.tight:
-            plt.tight_layout()
-        save(file_name, file_extension, close=True, verbose=True)
+    fig.suptitle(title)
+    show_or_save(fig, file_name, file_extension, show)
 
 
 def add_optional_prefix(base_string, prefix, separator):
     result = str(base_string)
     if prefix:
-        result = prefix + separator + base_string
+        result = prefix + separator + result
     return result
 
 
+def label_series(rdf, label_cols):
+    """Builds a plot label for every row of a dataframe
+
+    rdf: the results dataframe
+    label_cols: the columns used for the label. The value of the first column
+        is used as is, the remaining columns are added as name=value pairs.
+
+    Returns: a series of string labels aligned with rdf
+    """
+    labels = rdf[label_cols[0]].astype(str)
+    for col in label_cols[1:]:
+        labels = labels + ", " + col + "=" + rdf[col].astype(str)
+    return labels
+
+
+def read_results(args, worksheet):
+    """Reads, filters and aggregates the results from a single worksheet
+
+    args: the command line arguments
+    worksheet: worksheet name within the results file
+
+    Returns: a tuple containing the aggregated results dataframe, with one
+    row for each group, dimension and compute element combination, and a
+    dataframe of the individual runs that were dropped as outliers. The
+    speedup, efficiency and cost metric columns are added to the results,
+    and both dataframes get a series column holding the plot label of each
+    row.
+    """
+    group_cols = ["group"] + args.dimensions
+    usecols = group_cols + ["compute_elements", "walltime"]
+    if args.filter_column:
+        usecols.append(args.filter_column)
+
+    # optional hardware columns, renamed to the names used by scaling_metrics
+    hardware_columns = {
+        args.nodes_column: NODES_COLUMN,
+        args.cores_per_node_column: CORES_PER_NODE_COLUMN,
+        args.energy_column: ENERGY_COLUMN,
+        args.memory_column: MEMORY_COLUMN,
+    }
+    hardware_columns.pop("", None)
+    usecols.extend(hardware_columns)
+
+    results = read_dataframe_from_excel(
+        args.results_file, worksheet=worksheet, usecols=usecols
+    ).rename(columns=hardware_columns)
+
+    # filter out incomplete results
+    results = results[results.group.notnull() & (results.walltime > 0)]
+
+    # runs with a blank dimension value cannot be placed in a result group
+    blank_dimensions = results[args.dimensions].isnull().any(axis=1)
+    if blank_dimensions.any():
+        print(
+            "Dropped {0} runs with a blank dimension value from worksheet {1}".format(
+                blank_dimensions.sum(), worksheet
+            )
+        )
+        results = results[~blank_dimensions]
+
+    # apply the optional filter column
+    if args.filter_column:
+        results = results[results[args.filter_column] > 0]
+
+    # drop the outlying runs within each (group,dimensions,compute_element) cell
+    if args.outliers != "none":
+        outlier_rows = flag_outliers(
+            results,
+            method=args.outliers,
+            threshold=args.outlier_threshold,
+            cell_cols=group_cols + ["compute_elements"],
+        )
+        outliers = results[outlier_rows].copy()
+        results = results[~outlier_rows]
+    else:
+        outliers = results.iloc[:0].copy()
+    outliers["series"] = label_series(outliers, group_cols)
+
+    # if there are multiple times for each (group,dimensions,compute_element)
+    # tuple, calculate the mean
+    results = results.groupby(group_cols + ["compute_elements"]).mean().reset_index()
+
+    # calculate speedup, efficiency and the cost metrics over the whole table
+    (
+        results["speedup"],
+        results["strong_efficiency"],
+        results["weak_efficiency"],
+    ) = calculate_speedup_and_efficiency(
+        results, "compute_elements", "walltime", group_cols=group_cols
+    )
+    results = results.join(
+        calculate_cost_metrics(
+            results,
+            group_cols=group_cols,
+            seconds_per_time_unit=args.seconds_per_walltime_unit,
+            work_units=args.work_units,
+            core_hour_cost=args.core_hour_cost,
+        )
+    )
+
+    results["series"] = label_series(results, group_cols)
+    return (results, outliers)
+
+
+def split_series(results):
+    """Splits the results into a new dataframe for each plot series
+
+    Returns: a dictionary of series label to dataframe, sorted by the compute
+    elements
+    """
+    group_dataframes = {}
+    for name, df in results.groupby("series", sort=False):
+        group_dataframes[name] = df.sort_values(by="compute_elements", ascending=True)
+    return group_dataframes
+
+
+def render(templates, key, factory, file_name, **update_kwargs):
+    """Updates a plot template with new data, then shows or saves it
+
+    templates: dictionary of the templates created so far, keyed by plot type.
+        When saving to files, a template is created on first use and then
+        reused for every following dataset. Figures shown in a window are
+        destroyed when the window is closed, so they are always rebuilt.
+    key: the plot type
+    factory: callable that creates a new template for this plot type
+    file_name: the file name, without the extension
+    update_kwargs: passed to the template update method
+    """
+    if args.window:
+        template = factory()
+    else:
+        template = templates.get(key)
+        if template is None:
+            template = templates[key] = factory()
+
+    template.update(**update_kwargs)
+    show_or_save(
+        template.fig, file_name, args.file_extension, args.window, close=args.window
+    )
+
+
 if __name__ == "__main__":
 
     # get and process the arguments
@@ -420,129 +1040,311 @@ if __name__ == "__main__":
     plot_width = args.plot_width
     plot_size = (plot_width, plot_width * 3 / 4)
 
-    show_instead_of_save = args.window
+    compute_element_name = args.compute_element_name
+    walltime_units = args.walltime_units
 
-    walltime_title = add_optional_prefix("Walltime", args.title_prefix, " - ")
-    speedup_title = add_optional_prefix("Speedup", args.title_prefix, " - ")
+    def title(base_title, labels):
+        return add_optional_prefix(
+            add_optional_prefix(base_title, " - ".join(labels), " - "),
+            args.title_prefix,
+            " - ",
+        )
 
-    efficiency_title = add_optional_prefix("Efficiency", args.title_prefix, " - ")
+    def file_name(base_name, labels):
+        return add_optional_prefix(
+            add_optional_prefix(base_name, "-".join(labels), "-"),
+            args.file_prefix,
+            "-",
+        )
 
-    walltime_file = add_optional_prefix("walltime", args.file_prefix, "-")
-    speedup_file = add_optional_prefix("speedup", args.file_prefix, "-")
-    efficiency_file = add_optional_prefix(
-        "weak-efficiency" if args.weak else "strong-efficiency", args.file_prefix, "-"
-    )
+    # Each dataset is rendered to its own set of figures. The dataset labels
+    # are added to the titles and file names when there is more than one
+    # dataset.
+    datasets = []
+    for worksheet in args.worksheet_name:
+        results, outliers = read_results(args, worksheet)
+        group_dataframes = split_series(results)
+        labels = [worksheet] if len(args.worksheet_name) > 1 else []
+
+        if args.outliers != "none":
+            if labels:
+                print(worksheet)
+            print(
+                "Dropped {0} outlier runs using the {1} method".format(
+                    len(outliers), args.outliers
+                )
+            )
+            if len(outliers):
+                dropped = outliers.groupby(
+                    ["group"] + args.dimensions + ["compute_elements"]
+                ).size()
+                print(dropped.to_frame("dropped").to_string())
+
+        recommendations = None
+        if args.recommend:
+            recommendations = recommend_concurrency(
+                results,
+                threshold=args.efficiency_threshold,
+                project_count=None if args.weak else args.project_count,
+                efficiency_col="weak_efficiency" if args.weak else "strong_efficiency",
+            )
+            if args.weak:
+                # the speedup and Amdahl's law fit only apply to strong scaling
+                recommendations = recommendations.drop(
+                    columns=["recommended_speedup", "serial_fraction", "max_speedup"]
+                )
+            print(
+                "Recommended {0} ({1} efficiency threshold {2})".format(
+                    compute_element_name,
+                    "weak" if args.weak else "strong",
+                    args.efficiency_threshold,
+                )
+            )
+            if labels:
+                print(worksheet)
+            print(recommendations.to_string(float_format="{0:.3g}".format))
+
+        if args.html_report:
+            write_html_report(
+                results,
+                file_name("report", labels),
+                COLOURS,
+                weak=args.weak,
+                title=title("Scaling", labels),
+                compute_element_name=compute_element_name,
+                walltime_units=walltime_units,
+            )
 
-    compute_element_name = args.compute_element_name
-    walltime_units = args.walltime_units
+        if args.no_plots:
+            continue
+
+        if args.facet_rows or args.facet_columns:
+            plot_facets(
+                results,
+                args.dimensions,
+                args.facet_rows,
+                args.facet_columns,
+                COLOURS,
+                line_width=1.5,
+                speedup_max=args.speedup_max,
+                weak=args.weak,
+                facet_size=(plot_width / 2, plot_width * 3 / 8),
+                xlabel=compute_element_name,
+                title=title("Scaling", labels),
+                file_name=file_name("facets", labels),
+                file_extension=args.file_extension,
+                show=args.window,
+            )
 
-    usecols = ["group", "compute_elements", "walltime"]
-    if args.filter_column:
-        usecols.append(args.filter_column)
+        # pair the problem sizes with the compute element counts to make weak
+        # scaling curves
+        if args.weak_size_column:
+            curve_cols = ["group"] + [
+                d for d in args.dimensions if d != args.weak_size_column
+            ]
+            weak_curves = split_series(
+                derive_weak_scaling(
+                    results, args.weak_size_column, group_cols=curve_cols
+                ).assign(
+                    series=lambda df: label_series(
+                        df, curve_cols + ["size_per_element"]
+                    )
+                )
+            )
+            plot_efficiency(
+                [data.weak_efficiency for data in weak_curves.values()],
+                cycle_colours(len(weak_curves)),
+                list(weak_curves),
+                np.sort(results.compute_elements.unique()),
+                x_series=[data.compute_elements for data in weak_curves.values()],
+                line_width=1.5,
+                xmax=results.compute_elements.max() * 1.1,
+                ymax=1.3,
+                plot_size=plot_size,
+                xlabel=compute_element_name,
+                title=title("Derived Weak Efficiency", labels),
+                file_name=file_name("derived-weak-efficiency", labels),
+                file_extension=args.file_extension,
+                show=args.window,
+            )
 
-    results = read_dataframe_from_excel(
-        args.results_file, worksheet=args.worksheet_name, usecols=usecols
-    )
+        if args.per_group:
+            for group, data in group_dataframes.items():
+                datasets.append(
+                    (
+                        labels + [str(group)],
+                        {group: data},
+                        recommendations,
+                        outliers[outliers.series == group],
+                    )
+                )
+        else:
+            datasets.append((labels, group_dataframes, recommendations, outliers))
 
-    # filter out incomplete results
-    results = results[results.group.notnull() & (results.walltime > 0)]
+    templates = {}
+    for labels, group_dataframes, recommendations, outliers in datasets:
 
-    # apply the optional filter column
-    if args.filter_column:
-        results = results[results[args.filter_column] > 0]
+        # extract the compute element names for grouping and labelling the charts
+        compute_elements = np.sort(
+            np.unique(
+                np.concatenate(
+                    [data.compute_elements for data in group_dataframes.values()]
+                )
+            )
+        )
 
-    # if there are multiple times for each (group,compute_element) tuple,
-    # calculate the mean
-    results = results.groupby(["group", "compute_elements"]).mean().reset_index()
+        # build the collections of values for the charts
+        walltimes = []
+        strong_efficiencies = []
+        weak_efficiencies = []
+        speedups = []
+        series_names = []
+        metric_series = {m: [] for m in args.metrics}
+        max_walltime = 0
+        for name, data in group_dataframes.items():
+            # align each series on the shared compute element counts, leaving
+            # a gap where a series has no runs at a count
+            data = data.set_index("compute_elements").reindex(compute_elements)
+            walltimes.append(data.walltime)
+            strong_efficiencies.append(data.strong_efficiency)
+            weak_efficiencies.append(data.weak_efficiency)
+            speedups.append(data.speedup)
+            series_names.append(name)
+            for metric, values in metric_series.items():
+                if metric in data:
+                    values.append(data[metric])
+            local_max_walltime = data.walltime.max()
+            if local_max_walltime > max_walltime:
+                max_walltime = local_max_walltime
+
+        # the dropped runs of each series, marked on the walltime plot
+        outlier_points = None
+        if args.mark_outliers:
+            outlier_points = []
+            for name in series_names:
+                dropped = outliers[outliers.series == name]
+                outlier_points.append((dropped.compute_elements, dropped.walltime))
+            if len(outliers):
+                max_walltime = max(max_walltime, outliers.walltime.max())
+
+        # with extra dimensions there can be more series than colours
+        colours = cycle_colours(len(series_names))
+
+        # mark the recommended compute element counts
+        speedup_annotations = None
+        efficiency_annotations = None
+        threshold = None
+        if recommendations is not None:
+            recommended = recommendations.loc[series_names]
+            if not args.weak:
+                speedup_annotations = recommended[
+                    ["recommended", "recommended_speedup"]
+                ].to_numpy()
+            efficiency_annotations = recommended[
+                ["recommended", "recommended_efficiency"]
+            ].to_numpy()
+            threshold = args.efficiency_threshold
+
+        # finally make the plots
+
+        render(
+            templates,
+            "walltime",
+            lambda: WalltimePlotTemplate(
+                plot_size,
+                group_width=0.83,
+                xlabel=compute_element_name,
+                ylabel=walltime_units,
+            ),
+            file_name("walltime", labels),
+            series=walltimes,
+            colours=colours,
+            series_names=series_names,
+            compute_elements=compute_elements,
+            ymax=max_walltime * 1.2,
+            title=title("Walltime", labels),
+            outliers=outlier_points,
+        )
 
-    # create new dataframes for each group of results, sorted by the compute element
-    groups = results.group.unique()
-    group_dataframes = {}
-    for group in groups:
-        df = results[(results.group == group)]
-        if len(df):
-            group_dataframes[group] = df.sort_values(
-                by="compute_elements", ascending=True
-            )
+        render(
+            templates,
+            "efficiency",
+            lambda: LinePlotTemplate(
+                "efficiency",
+                line_width=1.5,
+                plot_size=plot_size,
+                xlabel=compute_element_name,
+                ylabel="Efficiency",
+            ),
+            file_name("weak-efficiency" if args.weak else "strong-efficiency", labels),
+            series=weak_efficiencies if args.weak else strong_efficiencies,
+            colours=colours,
+            series_names=series_names,
+            compute_elements=compute_elements,
+            xmax=compute_elements.max() * 1.1,
+            ymax=1.3,
+            title=title("Efficiency", labels),
+            annotations=efficiency_annotations,
+            threshold=threshold,
+        )
 
-    # calculate speedup and efficiency
-    for data in group_dataframes.values():
-        (
-            data["speedup"],
-            data["strong_efficiency"],
-            data["weak_efficiency"],
-        ) = calculate_speedup_and_efficiency(data, "compute_elements", "walltime")
+        # The Speedup plot makes no sense for weak scaling.
+        # I could create a new plot for weak scaling that shows the percentage
+        # increase in walltime as the compute elements increase
+        if not args.weak:
+            render(
+                templates,
+                "speedup",
+                lambda: LinePlotTemplate(
+                    "speedup",
+                    line_width=1.5,
+                    plot_size=plot_size,
+                    xlabel=compute_element_name,
+                    ylabel="Speedup",
+                ),
+                file_name("speedup", labels),
+                series=speedups,
+                colours=colours,
+                series_names=series_names,
+                compute_elements=compute_elements,
+                xmax=compute_elements.max() * 1.05,
+                ymin=compute_elements[0],
+                ymax=args.speedup_max,
+                title=title("Speedup", labels),
+                annotations=speedup_annotations,
+            )
 
-    # extract the compute element names for grouping and labelling the charts
-    compute_elements = np.sort(results.compute_elements.unique())
+        # cost metric plots, using the walltime plot styling.
+        # Metrics that need a missing optional column are skipped, as are
+        # metrics with no values, such as the parallel overhead of groups
+        # without a 1 compute element run.
+        for metric, values in metric_series.items():
+            if len(values) != len(series_names):
+                continue
+            all_values = np.concatenate([np.asarray(v, dtype=float) for v in values])
+            if np.isnan(all_values).all():
+                continue
+            # the parallel overhead is negative for superlinear scaling
+            metric_min = min(np.nanmin(all_values), 0)
+            metric_max = max(np.nanmax(all_values), 0)
+            render(
+                templates,
+                metric,
+                lambda: WalltimePlotTemplate(
+                    plot_size,
+                    group_width=0.83,
+                    xlabel=compute_element_name,
+                    ylabel=COST_METRICS[metric],
+                ),
+                file_name(metric.replace("_", "-"), labels),
+                series=values,
+                colours=colours,
+                series_names=series_names,
+                compute_elements=compute_elements,
+                ymax=metric_max * 1.2,
+                ymin=metric_min * 1.2,
+                title=title(COST_METRICS[metric], labels),
+            )
 
-    # build the collections of values for the charts
-    walltimes = []
-    strong_efficiencies = []
-    weak_efficiencies = []
-    speedups = []
-    series_names = []
-    max_walltime = 0
-    for name, data in group_dataframes.items():
-        walltimes.append(data.walltime)
-        strong_efficiencies.append(data.strong_efficiency)
-        weak_efficiencies.append(data.weak_efficiency)
-        speedups.append(data.speedup)
-        series_names.append(name)
-        local_max_walltime = max(data.walltime)
-        if local_max_walltime > max_walltime:
-            max_walltime = local_max_walltime
-
-    # finally make the plots
-
-    plot_walltime(
-        walltimes,
-        COLOURS,
-        series_names,
-        compute_elements,
-        ymax=max_walltime * 1.2,
-        group_width=0.83,
-        plot_size=plot_size,
-        title=walltime_title,
-        xlabel=compute_element_name,
-        ylabel=walltime_units,
-        show=show_instead_of_save,
-        file_name=walltime_file,
-        file_extension=args.file_extension,
-    )
-
-    plot_efficiency(
-        weak_efficiencies if args.weak else strong_efficiencies,
-        COLOURS,
-        series_names,
-        compute_elements,
-        line_width=1.5,
-        xmax=compute_elements.max() * 1.1,
-        ymax=1.3,
-        plot_size=plot_size,
-        xlabel=compute_element_name,
-        title=efficiency_title,
-        show=show_instead_of_save,
-        file_name=efficiency_file,
-        file_extension=args.file_extension,
-    )
-
-    # The Speedup plot makes no sense for weak scaling.
-    # I could create a new plot for weak scaling that shows the percentage
-    # increase in walltime as the compute elements increase
-    if not args.weak:
-        plot_speedup(
-            speedups,
-            COLOURS,
-            series_names,
-            compute_elements,
-            line_width=1.5,
-            xmax=compute_elements.max() * 1.05,
-            ymax=args.speedup_max,
-            plot_size=plot_size,
-            xlabel=compute_element_name,
-            title=speedup_title,
-            show=show_instead_of_save,
-            file_name=speedup_file,
-            file_extension=args.file_extension,
-        )
+    for template in templates.values():
+        plt.close(template.fig)
@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+"""Interactive HTML scaling reports.
+
+The aggregated results table is embedded in a single, self contained HTML
+file as a compact JSON payload. The walltime, speedup and efficiency charts
+are drawn in the browser, so Python only does the aggregation and no
+matplotlib rendering is needed. The report works offline: it does not load
+any external scripts or styles.
+"""
+
+import html
+import json
+import os
+
+import numpy as np
+
+# Charts in the report: (metric key in the payload, results column, title)
+STRONG_CHARTS = [
+    ("walltime", "walltime", "Walltime"),
+    ("speedup", "speedup", "Speedup"),
+    ("efficiency", "strong_efficiency", "Efficiency"),
+]
+WEAK_CHARTS = [
+    ("walltime", "walltime", "Walltime"),
+    ("efficiency", "weak_efficiency", "Efficiency"),
+]
+
+
+def _to_list(values):
+    """Converts a numeric series to a JSON friendly list, with NaN as None"""
+    values = np.round(values.to_numpy(dtype=float), 6)
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def build_report_payload(
+    results,
+    colours,
+    weak=False,
+    compute_element_name="Threads",
+    walltime_units="Minutes",
+):
+    """Builds the data embedded in the HTML report
+
+    results: the aggregated results dataframe, with a series label column
+    colours: the series colours. They are repeated if there are more series
+        than colours.
+    weak: if True, the report shows weak scaling efficiency and no speedup
+
+    Returns: a dictionary that can be serialised to JSON
+    """
+    charts = WEAK_CHARTS if weak else STRONG_CHARTS
+    ordered = results.sort_values(by=["series", "compute_elements"])
+
+    series = []
+    for i, (name, data) in enumerate(ordered.groupby("series", sort=False)):
+        entry = {"name": str(name), "colour": colours[i % len(colours)]}
+        entry["x"] = _to_list(data.compute_elements)
+        for key, column, _ in charts:
+            entry[key] = _to_list(data[column])
+        series.append(entry)
+
+    return {
+        "xlabel": compute_element_name,
+        "compute_elements": _to_list(
+            ordered.compute_elements.drop_duplicates().sort_values()
+        ),
+        "charts": [
+            {
+                "metric": key,
+                "title": chart_title,
+                "ylabel": walltime_units if key == "walltime" else chart_title,
+                "reference": key if key != "walltime" else None,
+            }
+            for key, _, chart_title in charts
+        ],
+        "series": series,
+    }
+
+
+def write_html_report(
+    results,
+    path,
+    colours,
+    weak=False,
+    title="Scaling",
+    compute_element_name="Threads",
+    walltime_units="Minutes",
+    verbose=True,
+):
+    """Writes an interactive HTML scaling report
+
+    results: the aggregated results dataframe, with a series label column
+    path: the path (and filename, without the extension) to save the
+        report to
+    colours: the series colours
+    weak: if True, the report shows weak scaling efficiency and no speedup
+    title: the report title
+    verbose: whether to print information about where the report was saved
+    """
+    payload = build_report_payload(
+        results, colours, weak, compute_element_name, walltime_units
+    )
+
+    # "</" must not appear inside the script element
+    data = json.dumps(payload, separators=(",", ":")).replace("</", "<\\/")
+    document = (
+        HTML_TEMPLATE.replace("__TITLE__", html.escape(title))
+        .replace("__STYLE__", REPORT_STYLE)
+        .replace("__SCRIPT__", REPORT_SCRIPT)
+        .replace("__DATA__", data)
+    )
+
+    # If the directory does not exist, create it
+    directory = os.path.split(path)[0] or "."
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    savepath = os.path.join(directory, "%s.html" % os.path.split(path)[1])
+    if verbose:
+        print("Saving report to '%s'..." % savepath)
+
+    with open(savepath, "w", encoding="utf-8") as f:
+        f.write(document)
+
+    if verbose:
+        print("Done")
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>__STYLE__</style>
+</head>
+<body>
+<header>
+  <h1>__TITLE__</h1>
+  <label><input type="checkbox" id="log-x"> Log scale X axis</label>
+  <span class="hint">Drag to zoom, scroll to zoom around the cursor, double click to reset.</span>
+</header>
+<main>
+  <section id="charts"></section>
+  <aside>
+    <input type="search" id="filter" placeholder="Filter groups">
+    <div class="buttons">
+      <button id="show-all">All</button>
+      <button id="show-none">None</button>
+    </div>
+    <ul id="legend"></ul>
+  </aside>
+</main>
+<div id="tooltip"></div>
+<script type="application/json" id="scaling-data">__DATA__</script>
+<script>__SCRIPT__</script>
+</body>
+</html>
+"""
+
+REPORT_STYLE = """
+body { font-family: sans-serif; margin: 0; color: #222; }
+header { padding: 8px 16px; border-bottom: 1px solid #ddd; }
+header h1 { font-size: 1.3em; margin: 4px 0; }
+header .hint { color: #777; font-size: 0.85em; margin-left: 16px; }
+main { display: flex; align-items: flex-start; }
+#charts { flex: 1; min-width: 0; }
+.chart { position: relative; height: 380px; margin: 8px 16px; }
+.chart canvas { width: 100%; height: 100%; cursor: crosshair; }
+aside { width: 280px; max-height: 100vh; overflow-y: auto; padding: 8px;
+        position: sticky; top: 0; border-left: 1px solid #ddd; }
+aside input[type=search] { width: 100%; box-sizing: border-box; }
+aside .buttons { margin: 6px 0; }
+#legend { list-style: none; padding: 0; margin: 0; font-size: 0.85em; }
+#legend li { display: flex; align-items: center; padding: 1px 0; cursor: pointer; }
+#legend li.hidden { color: #aaa; }
+#legend .swatch { width: 14px; height: 4px; margin: 0 6px; flex: none; }
+#tooltip { position: fixed; pointer-events: none; display: none; background: #fff;
+           border: 1px solid #999; padding: 4px 6px; font-size: 0.8em; }
+"""
+
+REPORT_SCRIPT = r"""
+(function () {
+  "use strict";
+  var payload = JSON.parse(document.getElementById("scaling-data").textContent);
+  var series = payload.series;
+  var visible = series.map(function () { return true; });
+  var logX = false;
+  var MARGIN = { left: 64, right: 16, top: 28, bottom: 44 };
+  var tooltip = document.getElementById("tooltip");
+
+  function tx(x) { return logX ? Math.log(x) / Math.LN2 : x; }
+
+  function niceTicks(lo, hi, count) {
+    var span = hi - lo;
+    if (!(span > 0)) { return [lo]; }
+    var step = Math.pow(10, Math.floor(Math.log(span / count) / Math.LN10));
+    var err = span / count / step;
+    if (err >= 7.5) { step *= 10; } else if (err >= 3) { step *= 5; } else if (err >= 1.5) { step *= 2; }
+    var ticks = [];
+    for (var t = Math.ceil(lo / step) * step; t <= hi + step * 1e-9; t += step) {
+      ticks.push(Math.abs(t) < step * 1e-9 ? 0 : t);
+    }
+    return ticks;
+  }
+
+  function formatNumber(v) {
+    if (v === 0) { return "0"; }
+    var a = Math.abs(v);
+    if (a >= 1e5 || a < 1e-3) { return v.toExponential(2); }
+    return String(Math.round(v * 1000) / 1000);
+  }
+
+  function dataView(chart) {
+    var x0 = Infinity, x1 = -Infinity, y1 = -Infinity;
+    series.forEach(function (s, i) {
+      if (!visible[i]) { return; }
+      var ys = s[chart.metric];
+      s.x.forEach(function (x, j) {
+        if (ys[j] === null) { return; }
+        x0 = Math.min(x0, x); x1 = Math.max(x1, x); y1 = Math.max(y1, ys[j]);
+      });
+    });
+    if (!isFinite(x0)) { x0 = 1; x1 = 2; y1 = 1; }
+    if (chart.reference === "efficiency") { y1 = Math.max(y1, 1); }
+    var lo = tx(x0), hi = tx(x1), pad = ((hi - lo) || 1) * 0.05;
+    return { x0: lo - pad, x1: hi + pad, y0: 0, y1: (y1 || 1) * 1.1 };
+  }
+
+  function Chart(config, parent) {
+    this.metric = config.metric;
+    this.title = config.title;
+    this.ylabel = config.ylabel;
+    this.reference = config.reference;
+    var div = document.createElement("div");
+    div.className = "chart";
+    this.canvas = document.createElement("canvas");
+    div.appendChild(this.canvas);
+    parent.appendChild(div);
+    this.ctx = this.canvas.getContext("2d");
+    this.view = null;
+    this.drag = null;
+    this.bindEvents();
+  }
+
+  Chart.prototype.resize = function () {
+    var ratio = window.devicePixelRatio || 1;
+    this.width = this.canvas.clientWidth;
+    this.height = this.canvas.clientHeight;
+    this.canvas.width = this.width * ratio;
+    this.canvas.height = this.height * ratio;
+    this.ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+  };
+
+  Chart.prototype.reset = function () { this.view = dataView(this); };
+
+  Chart.prototype.px = function (x) {
+    var w = this.width - MARGIN.left - MARGIN.right;
+    return MARGIN.left + (tx(x) - this.view.x0) / (this.view.x1 - this.view.x0) * w;
+  };
+
+  Chart.prototype.py = function (y) {
+    var h = this.height - MARGIN.top - MARGIN.bottom;
+    return MARGIN.top + h - (y - this.view.y0) / (this.view.y1 - this.view.y0) * h;
+  };
+
+  Chart.prototype.invert = function (px, py) {
+    var w = this.width - MARGIN.left - MARGIN.right;
+    var h = this.height - MARGIN.top - MARGIN.bottom;
+    return {
+      x: this.view.x0 + (px - MARGIN.left) / w * (this.view.x1 - this.view.x0),
+      y: this.view.y0 + (MARGIN.top + h - py) / h * (this.view.y1 - this.view.y0)
+    };
+  };
+
+  Chart.prototype.draw = function () {
+    var ctx = this.ctx, self = this, v = this.view;
+    var left = MARGIN.left, top = MARGIN.top;
+    var right = this.width - MARGIN.right, bottom = this.height - MARGIN.bottom;
+    ctx.clearRect(0, 0, this.width, this.height);
+    ctx.font = "12px sans-serif";
+    ctx.fillStyle = "#222";
+    ctx.strokeStyle = "#eee";
+    ctx.lineWidth = 1;
+
+    // y axis ticks and grid
+    ctx.textAlign = "right";
+    ctx.textBaseline = "middle";
+    niceTicks(v.y0, v.y1, 6).forEach(function (t) {
+      var y = self.py(t);
+      ctx.beginPath(); ctx.moveTo(left, y); ctx.lineTo(right, y); ctx.stroke();
+      ctx.fillText(formatNumber(t), left - 6, y);
+    });
+
+    // x axis ticks at the compute element counts, thinned to fit
+    ctx.textAlign = "center";
+    ctx.textBaseline = "top";
+    var lastX = -Infinity;
+    payload.compute_elements.forEach(function (t) {
+      var x = self.px(t);
+      if (x < left || x > right || x - lastX < 32) { return; }
+      lastX = x;
+      ctx.beginPath(); ctx.moveTo(x, top); ctx.lineTo(x, bottom); ctx.stroke();
+      ctx.fillText(formatNumber(t), x, bottom + 6);
+    });
+
+    // labels and frame
+    ctx.fillText(payload.xlabel, (left + right) / 2, bottom + 24);
+    ctx.font = "bold 14px sans-serif";
+    ctx.fillText(this.title, (left + right) / 2, 6);
+    ctx.save();
+    ctx.font = "12px sans-serif";
+    ctx.translate(14, (top + bottom) / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(this.ylabel, 0, 0);
+    ctx.restore();
+    ctx.strokeStyle = "#222";
+    ctx.strokeRect(left, top, right - left, bottom - top);
+
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(left, top, right - left, bottom - top);
+    ctx.clip();
+
+    // ideal speedup and efficiency reference lines
+    ctx.strokeStyle = "red";
+    ctx.lineWidth = 1.5;
+    if (this.reference === "speedup") {
+      var xs = payload.compute_elements;
+      ctx.beginPath();
+      xs.forEach(function (x, i) {
+        if (i === 0) { ctx.moveTo(self.px(x), self.py(x)); } else { ctx.lineTo(self.px(x), self.py(x)); }
+      });
+      ctx.stroke();
+    } else if (this.reference === "efficiency") {
+      ctx.beginPath(); ctx.moveTo(left, this.py(1)); ctx.lineTo(right, this.py(1)); ctx.stroke();
+    }
+
+    // the series
+    series.forEach(function (s, i) {
+      if (!visible[i]) { return; }
+      var ys = s[self.metric];
+      ctx.strokeStyle = s.colour;
+      ctx.fillStyle = s.colour;
+      ctx.beginPath();
+      var pen = false;
+      s.x.forEach(function (x, j) {
+        if (ys[j] === null) { pen = false; return; }
+        if (pen) { ctx.lineTo(self.px(x), self.py(ys[j])); } else { ctx.moveTo(self.px(x), self.py(ys[j])); }
+        pen = true;
+      });
+      ctx.stroke();
+      s.x.forEach(function (x, j) {
+        if (ys[j] === null) { return; }
+        ctx.beginPath(); ctx.arc(self.px(x), self.py(ys[j]), 3, 0, 2 * Math.PI); ctx.fill();
+      });
+    });
+
+    // zoom selection box
+    if (this.drag && this.drag.moved) {
+      ctx.fillStyle = "rgba(0, 0, 0, 0.08)";
+      ctx.strokeStyle = "#555";
+      ctx.lineWidth = 1;
+      var d = this.drag;
+      ctx.fillRect(d.x0, d.y0, d.x1 - d.x0, d.y1 - d.y0);
+      ctx.strokeRect(d.x0, d.y0, d.x1 - d.x0, d.y1 - d.y0);
+    }
+    ctx.restore();
+  };
+
+  Chart.prototype.nearest = function (px, py) {
+    var best = null, bestDistance = 100, self = this;
+    series.forEach(function (s, i) {
+      if (!visible[i]) { return; }
+      var ys = s[self.metric];
+      s.x.forEach(function (x, j) {
+        if (ys[j] === null) { return; }
+        var dx = self.px(x) - px, dy = self.py(ys[j]) - py, distance = dx * dx + dy * dy;
+        if (distance < bestDistance) { bestDistance = distance; best = { s: s, x: x, y: ys[j] }; }
+      });
+    });
+    return best;
+  };
+
+  Chart.prototype.bindEvents = function () {
+    var self = this, canvas = this.canvas;
+
+    function position(event) {
+      var rect = canvas.getBoundingClientRect();
+      return { x: event.clientX - rect.left, y: event.clientY - rect.top };
+    }
+
+    canvas.addEventListener("mousedown", function (event) {
+      var p = position(event);
+      self.drag = { x0: p.x, y0: p.y, x1: p.x, y1: p.y, moved: false };
+    });
+
+    canvas.addEventListener("mousemove", function (event) {
+      var p = position(event);
+      if (self.drag) {
+        self.drag.x1 = p.x;
+        self.drag.y1 = p.y;
+        self.drag.moved = Math.abs(p.x - self.drag.x0) > 4 || Math.abs(p.y - self.drag.y0) > 4;
+        self.draw();
+        return;
+      }
+      var hit = self.nearest(p.x, p.y);
+      if (!hit) { tooltip.style.display = "none"; return; }
+      tooltip.textContent = hit.s.name + ": " + payload.xlabel + " " + formatNumber(hit.x) +
+        ", " + self.ylabel + " " + formatNumber(hit.y);
+      tooltip.style.borderColor = hit.s.colour;
+      tooltip.style.left = (event.clientX + 12) + "px";
+      tooltip.style.top = (event.clientY + 12) + "px";
+      tooltip.style.display = "block";
+    });
+
+    canvas.addEventListener("mouseleave", function () { tooltip.style.display = "none"; });
+
+    window.addEventListener("mouseup", function () {
+      var d = self.drag;
+      self.drag = null;
+      if (d && d.moved) {
+        var a = self.invert(Math.min(d.x0, d.x1), Math.max(d.y0, d.y1));
+        var b = self.invert(Math.max(d.x0, d.x1), Math.min(d.y0, d.y1));
+        self.view = { x0: a.x, x1: b.x, y0: a.y, y1: b.y };
+        self.draw();
+      }
+    });
+
+    canvas.addEventListener("wheel", function (event) {
+      event.preventDefault();
+      var p = position(event), c = self.invert(p.x, p.y), v = self.view;
+      var k = event.deltaY < 0 ? 0.8 : 1.25;
+      self.view = {
+        x0: c.x + (v.x0 - c.x) * k, x1: c.x + (v.x1 - c.x) * k,
+        y0: c.y + (v.y0 - c.y) * k, y1: c.y + (v.y1 - c.y) * k
+      };
+      self.draw();
+    }, { passive: false });
+
+    canvas.addEventListener("dblclick", function () { self.reset(); self.draw(); });
+  };
+
+  var container = document.getElementById("charts");
+  var charts = payload.charts.map(function (config) { return new Chart(config, container); });
+
+  function redraw(resetViews) {
+    charts.forEach(function (chart) {
+      if (resetViews || !chart.view) { chart.reset(); }
+      chart.draw();
+    });
+  }
+
+  // group toggling
+  var legend = document.getElementById("legend");
+  var items = series.map(function (s, i) {
+    var li = document.createElement("li");
+    var box = document.createElement("input");
+    box.type = "checkbox";
+    box.checked = true;
+    var swatch = document.createElement("span");
+    swatch.className = "swatch";
+    swatch.style.background = s.colour;
+    li.appendChild(box);
+    li.appendChild(swatch);
+    li.appendChild(document.createTextNode(s.name));
+    li.addEventListener("click", function (event) {
+      if (event.target !== box) { box.checked = !box.checked; }
+      setVisible(i, box.checked);
+      redraw(true);
+    });
+    legend.appendChild(li);
+    return { li: li, box: box };
+  });
+
+  function setVisible(i, state) {
+    visible[i] = state;
+    items[i].box.checked = state;
+    items[i].li.className = state ? "" : "hidden";
+  }
+
+  function setMatching(state) {
+    var text = document.getElementById("filter").value.toLowerCase();
+    series.forEach(function (s, i) {
+      if (s.name.toLowerCase().indexOf(text) >= 0) { setVisible(i, state); }
+    });
+    redraw(true);
+  }
+
+  document.getElementById("filter").addEventListener("input", function () {
+    var text = this.value.toLowerCase();
+    series.forEach(function (s, i) {
+      items[i].li.style.display = s.name.toLowerCase().indexOf(text) >= 0 ? "" : "none";
+    });
+  });
+  document.getElementById("show-all").addEventListener("click", function () { setMatching(true); });
+  document.getElementById("show-none").addEventListener("click", function () { setMatching(false); });
+  document.getElementById("log-x").addEventListener("change", function () {
+    logX = this.checked;
+    redraw(true);
+  });
+  window.addEventListener("resize", function () {
+    charts.forEach(function (chart) { chart.resize(); });
+    redraw(false);
+  });
+
+  charts.forEach(function (chart) { chart.resize(); });
+  redraw(true);
+})();
+"""